@@ -1,16 +1,26 @@
 import os
 import sys
+import threading
 from queue import Queue
 from time import time
 from PyQt5 import QtCore, QtWidgets
 from wikimusic import resources, util, view, model, dialog, thread, debug
+from wikimusic import collector, network, pool, limiter, retry, hedge, deadline, planner
 
 # debug.enable()
 
+# 'thread' or 'pipeline', there is no asyncio engine: lookups use blocking requests and each host is capped at
+# limiter.MAX_CONCURRENCY requests in flight, so more concurrent lookups would only wait
+COLLECTOR = 'thread'
+
 
 class Window(QtWidgets.QMainWindow):
     q = Queue()
-    threads = [thread.CollectorThread() for _ in range(10)]
+    if COLLECTOR == 'pipeline':
+        threads = [thread.PipelineThread()]
+    else:
+        threads = [thread.CollectorThread() for _ in range(10)]
+    revalidate_thread = thread.RevalidateThread()
 
     def __init__(self):
         super().__init__()
@@ -23,11 +33,15 @@ class Window(QtWidgets.QMainWindow):
 
     # region Setup
     def __setup(self):
+        self.depth_timer = QtCore.QTimer(self)
+        self.depth_timer.timeout.connect(self.__handle_depth_update)
         self.tasks = 0
+        self.covers = 0
         self.is_collecting = False
         self.start = None
         self.dir = None
         self.mp3_files = None
+        self.duplicates = {}
 
     def __menu(self):
         # Status Bar
@@ -46,6 +60,10 @@ class Window(QtWidgets.QMainWindow):
         action_import_folder.setShortcut('Ctrl+Shift+I')
         action_import_folder.triggered.connect(self.__handle_import_folder)
 
+        action_revalidate = QtWidgets.QAction('&Revalidate Cache', self)
+        action_revalidate.triggered.connect(self.__handle_revalidate)
+        self.revalidate_thread.revalidated.connect(self.__handle_revalidated)
+
         action_quit = QtWidgets.QAction(util.icon('close.png'), '&Exit', self)
         action_quit.setShortcut('Shift+F4')
         action_quit.triggered.connect(QtWidgets.qApp.quit)
@@ -55,6 +73,8 @@ class Window(QtWidgets.QMainWindow):
         file_menu.addAction(action_import)
         file_menu.addAction(action_import_folder)
         file_menu.addSeparator()
+        file_menu.addAction(action_revalidate)
+        file_menu.addSeparator()
         file_menu.addAction(action_quit)
 
         # NOTE Debug
@@ -140,12 +160,24 @@ class Window(QtWidgets.QMainWindow):
         d = QtWidgets.QFileDialog.getExistingDirectory(parent=self)
         self.__import_folder(d)
 
+    def __handle_revalidate(self):
+        if not self.is_collecting and not self.revalidate_thread.isRunning():
+            self.status_bar.showMessage('Revalidating cache')
+            self.revalidate_thread.start()
+
+    def __handle_revalidated(self, invalidated):
+        self.status_bar.showMessage('Cache revalidated, {} stale item(s) removed'.format(invalidated))
+
     def __handle_progress_update(self, value):
         self.progress_bar.setValue(self.progress_bar.value() + value)
 
     def __handle_status_update(self, item, status):
         item.update_status(status)
 
+    def __handle_depth_update(self):
+        depths = ', '.join('{} {}'.format(k, v) for k, v in self.threads[0].pipeline.depths().items())
+        self.status_bar.showMessage('Collecting data ({})'.format(depths))
+
     def __handle_selection_change(self, selection):
         self.selection_label.setText('{}/{}'.format(selection, len(self.mp3_files)))
     # endregion
@@ -156,8 +188,10 @@ class Window(QtWidgets.QMainWindow):
             if not self.is_collecting:
                 self.status_bar.showMessage('Collecting data')
                 self.start = time()
+                deadline.start_job()
                 self.is_collecting = True
                 self.tasks = len(items)
+                self.covers = len(items)
                 self.save_button.setDisabled(True)
                 self.progress_bar.setValue(0)
                 self.progress_bar.setRange(0, self.tasks * thread.CollectorThread.MAX)
@@ -166,26 +200,82 @@ class Window(QtWidgets.QMainWindow):
                     if not t.isRunning():
                         t.q = self.q
                         t.collected.connect(self.__finish_collect)
+                        t.cover_collected.connect(self.__finish_cover)
                         t.status_update.connect(self.__handle_status_update)
                         t.global_progress_update.connect(self.__handle_progress_update)
                         t.daemon = True
                         t.start()
 
-                for item in items:
+                if COLLECTOR == 'pipeline':
+                    self.depth_timer.start(500)
+
+                queued, self.duplicates = self.__plan(items)
+                # Cache lookups for a whole import would block the GUI, resolve in the background
+                threading.Thread(target=self.__prefetch, args=(queued,), daemon=True).start()
+                for item in queued:
                     self.q.put(item)
             else:
                 self.status_bar.showMessage('Collector is still running, please wait')
         else:
             self.status_bar.showMessage('No data to collect...')
 
+    @staticmethod
+    def __prefetch(items):
+        # Resolve the query collectors will send first, not the raw tag title
+        queries = (planner.plan(item.model, count=False) for item in items)
+        network.prefetch([planned[0].title for planned in queries if planned])
+
+    def __plan(self, items):
+        # Identical (artist, title) pairs are collected once and share the result
+        leaders = {}
+        duplicates = {}
+        for item in items:
+            song = item.model
+            key = (util.normalize_title(song.artist or ''), util.normalize_title(song.title or ''))
+            if key in leaders:
+                duplicates.setdefault(leaders[key], []).append(item)
+            else:
+                leaders[key] = item
+        return list(leaders.values()), duplicates
+
     def __finish_collect(self, item, collected):
         self.tasks -= 1
         if collected:
             item.update()
-        if self.tasks == 0:
+        # Duplicates of a collected item wait for its cover as well
+        duplicates = self.duplicates.get(item, []) if collected else self.duplicates.pop(item, [])
+        for duplicate in duplicates:
+            if collected:
+                duplicate.model.copy_collected(item.model)
+            duplicate.update_status(collector.SUCCESS if collected else collector.FAILURE)
+            self.__handle_progress_update(collector.MAX)
+            self.__finish_collect(duplicate, collected)
+            if not collected:
+                self.__finish_cover(duplicate)
+        self.__check_done()
+
+    def __finish_cover(self, item):
+        self.covers -= 1
+        item.update_cover()
+        for duplicate in self.duplicates.pop(item, []):
+            duplicate.model.cover = item.model.cover
+            self.__finish_cover(duplicate)
+        self.__check_done()
+
+    def __check_done(self):
+        if self.tasks == 0 and self.covers == 0:
+            self.depth_timer.stop()
             self.is_collecting = False
             self.save_button.setDisabled(False)
             self.status_bar.showMessage('Done in {:.2f}s'.format(time() - self.start))
+            network.flush_caches()
+            debug.log(network.cache_stats())
+            debug.log(pool.stats())
+            debug.log(limiter.stats())
+            debug.log(retry.stats())
+            debug.log(hedge.stats())
+            debug.log(collector.stats())
+            debug.log(planner.stats())
 
     def __save(self, items):
         if items:
@@ -226,6 +316,7 @@ sys.excepthook = hook
 if __name__ == "__main__":
     app = QtWidgets.QApplication(sys.argv)
     window = Window()
+    app.aboutToQuit.connect(network.flush_caches)
     window.show()
     try:
         sys.exit(app.exec_())
@@ -0,0 +1,217 @@
+import os
+import math
+import hashlib
+import pickle
+import sqlite3
+import threading
+from time import time
+
+# region Constants
+DIRECTORY = os.path.join(os.path.expanduser('~'), '.wikimusic')
+MAX_SIZE = 256 * 1024 * 1024
+TTL = 60 * 60 * 24 * 30
+BLOOM_CAPACITY = 100000
+BLOOM_ERROR_RATE = 0.01
+ACCESS_BATCH = 256
+# endregion
+
+
+class DiskCache(object):
+    def __init__(self, name, max_size=MAX_SIZE, ttl=TTL, directory=DIRECTORY):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__lock = threading.Lock()
+        self.__connection = None
+        self.__directory = directory
+        self.__size = 0
+        self.__accessed = {}
+
+    # region Setup
+    def __connect(self):
+        if not self.__connection:
+            os.makedirs(self.__directory, exist_ok=True)
+            connection = sqlite3.connect(os.path.join(self.__directory, '{}.db'.format(self.name)),
+                                         check_same_thread=False)
+            # Readers never wait on a writer, commits do not fsync every time
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS entries ('
+                               'key TEXT PRIMARY KEY, value BLOB, size INTEGER, expires REAL, accessed REAL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+            connection.commit()
+            self.__size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+            self.__connection = connection
+        return self.__connection
+
+    # endregion
+
+    # region Methods
+    def get(self, key, default=None):
+        with self.__lock:
+            connection = self.__connect()
+            row = connection.execute('SELECT value, expires FROM entries WHERE key = ?', (key,)).fetchone()
+            value = self.__load(row[0]) if row and row[1] > time() else None
+            if value is not None:
+                # Access times are only needed for eviction, write them in batches
+                self.__accessed[key] = time()
+                if len(self.__accessed) >= ACCESS_BATCH:
+                    self.__flush(connection)
+                    connection.commit()
+                self.hits += 1
+                return value
+            if row:
+                self.__delete(connection, [key])
+                connection.commit()
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires = time() + (self.ttl if ttl is None else ttl)
+        with self.__lock:
+            connection = self.__connect()
+            self.__delete(connection, [key])
+            connection.execute('INSERT INTO entries (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)',
+                               (key, data, len(data), expires, time()))
+            self.__size += len(data)
+            self.__evict(connection)
+            self.__flush(connection)
+            connection.commit()
+
+    def flush(self):
+        with self.__lock:
+            if self.__accessed:
+                connection = self.__connect()
+                self.__flush(connection)
+                connection.commit()
+
+    def delete(self, key):
+        with self.__lock:
+            connection = self.__connect()
+            self.__delete(connection, [key])
+            connection.commit()
+
+    def keys(self):
+        with self.__lock:
+            connection = self.__connect()
+            return [row[0] for row in connection.execute('SELECT key FROM entries WHERE expires > ?', (time(),))]
+
+    def items(self):
+        with self.__lock:
+            connection = self.__connect()
+            rows = connection.execute('SELECT key, value FROM entries WHERE expires > ?', (time(),)).fetchall()
+            return [(key, value) for key, value in ((k, self.__load(v)) for k, v in rows) if value is not None]
+
+    def clear(self):
+        with self.__lock:
+            connection = self.__connect()
+            connection.execute('DELETE FROM entries')
+            connection.commit()
+            self.__size = 0
+            self.__accessed.clear()
+
+    def __contains__(self, key):
+        with self.__lock:
+            connection = self.__connect()
+            return bool(connection.execute('SELECT 1 FROM entries WHERE key = ? AND expires > ?',
+                                           (key, time())).fetchone())
+
+    # endregion
+
+    # region Properties
+    @property
+    def size(self):
+        with self.__lock:
+            self.__connect()
+            return self.__size
+
+    @property
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size': self.size,
+        }
+
+    # endregion
+
+    # region Helpers
+    @staticmethod
+    def __load(data):
+        try:
+            return pickle.loads(data)
+        except (pickle.UnpicklingError, AttributeError, ImportError, EOFError, TypeError, ValueError):
+            # Entry written by an older version
+            return None
+
+    def __flush(self, connection):
+        connection.executemany('UPDATE entries SET accessed = ? WHERE key = ?',
+                               [(accessed, key) for key, accessed in self.__accessed.items()])
+        self.__accessed.clear()
+
+    def __delete(self, connection, keys):
+        for key in keys:
+            self.__accessed.pop(key, None)
+            row = connection.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+            if row:
+                connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+                self.__size -= row[0]
+
+    def __evict(self, connection):
+        if self.__size <= self.max_size:
+            return
+        self.__flush(connection)
+        connection.execute('DELETE FROM entries WHERE expires <= ?', (time(),))
+        self.__size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        evicted = []
+        excess = self.__size - self.max_size
+        for key, size in connection.execute('SELECT key, size FROM entries ORDER BY accessed').fetchall():
+            if excess <= 0:
+                break
+            evicted.append(key)
+            excess -= size
+        self.__delete(connection, evicted)
+        self.evictions += len(evicted)
+
+    # endregion
+    pass
+
+
+class BloomFilter(object):
+    def __init__(self, capacity=BLOOM_CAPACITY, error_rate=BLOOM_ERROR_RATE):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.__bits = bytearray((self.size + 7) // 8)
+        self.__lock = threading.Lock()
+
+    # region Methods
+    def add(self, key):
+        with self.__lock:
+            for i in self.__indexes(key):
+                self.__bits[i // 8] |= 1 << (i % 8)
+
+    def update(self, keys):
+        for key in keys:
+            self.add(key)
+
+    def __contains__(self, key):
+        return all(self.__bits[i // 8] & (1 << (i % 8)) for i in self.__indexes(key))
+
+    # endregion
+
+    # region Helpers
+    def __indexes(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    # endregion
+    pass
@@ -0,0 +1,263 @@
+import copy
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError
+from wikimusic import network, deadline, planner
+
+# region Constants
+MAX = 10
+SUCCESS = "<font color='green'>Success</font>"
+FAILURE = "<font color='red'>Failure</font>"
+TIMEOUT = "<font color='orange'>Deadline</font>"
+DEFERRED_COVERS = True
+SPECULATIVE = False
+SPECULATION_WORKERS = 64
+# endregion
+
+speculation_executor = ThreadPoolExecutor(max_workers=SPECULATION_WORKERS)
+wins = collections.Counter()
+wins_lock = threading.Lock()
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Collector(object):
+    def __init__(self, item, send, progress, budget=None, deferred=DEFERRED_COVERS, speculative=SPECULATIVE):
+        self.item = item
+        self.budget = budget or deadline.for_item()
+        self.covers = [] if deferred else None
+        self.speculative = speculative
+        self.tentative = None
+        self.queries = []
+        self.cancelled = threading.Event()
+        self.__send = send
+        self.__progress = progress
+        self.__i = 0
+        self.__decided = threading.Event()
+        self.__lock = threading.Lock()
+
+    # region Main Execution
+    def run(self):
+        with deadline.scope(self.budget):
+            try:
+                return self.collect()
+            except deadline.DeadlineExceeded:
+                # Out of time, a doubtful page found so far still beats nothing
+                self.i = MAX
+                self.send(TIMEOUT)
+                complete = self.settle(self.item.model)
+                if complete:
+                    self.send(SUCCESS)
+                return complete
+
+    def collect(self):
+        if self.speculative:
+            return self.race()
+
+        song = self.item.model
+        queries = self.queries = planner.plan(song)
+        complete = False
+        for n, query in enumerate(queries):
+            if n:
+                self.i = max(self.i, MAX * n / len(queries))
+            self.step('Page Request')
+            complete = self.process_request(song, query)
+            planner.record(queries, query, complete)
+            if complete:
+                break
+        if not complete:
+            complete = self.settle(song)
+        self.i = MAX
+        self.send(SUCCESS if complete else FAILURE)
+        return complete
+
+    def race(self):
+        # Title and fallback query run side by side, the first accepted page wins
+        song = self.item.model
+        queries = self.queries = planner.plan(song)
+        self.step('Page Request')
+        branches = collections.OrderedDict()
+        for query in queries:
+            branch = Collector(self.item, self.__relay_send, self.__relay_progress, self.budget,
+                               self.covers is not None, False)
+            draft = copy.copy(song)
+            future = speculation_executor.submit(deadline.wrap(branch.speculate), draft, query)
+            branches[future] = (branch, draft, query)
+
+        winner = None
+        try:
+            for future in as_completed(branches, timeout=deadline.remaining()):
+                try:
+                    complete = future.result()
+                except deadline.DeadlineExceeded:
+                    raise
+                except Exception as e:
+                    print(e)
+                    complete = False
+                if complete:
+                    winner = branches[future]
+                    break
+        except TimeoutError:
+            raise deadline.DeadlineExceeded('Deadline exceeded racing lookups')
+        finally:
+            self.__decided.set()
+            for branch, _, _ in branches.values():
+                branch.cancelled.set()
+            if not winner:
+                # No branch was confident, keep the best doubtful page of either for settling
+                tentatives = [branch.tentative for branch, _, _ in branches.values() if branch.tentative]
+                self.tentative = max(tentatives, key=lambda t: t.score) if tentatives else None
+
+        if winner:
+            branch, draft, query = winner
+            planner.record(queries, query, True)
+            song.copy_collected(draft)
+            for cover in branch.covers or []:
+                self.covers.append(cover)
+                cover.add_done_callback(lambda future: setattr(song, 'cover', draft.cover))
+            complete = True
+        else:
+            query = self.tentative.query if self.tentative else None
+            complete = self.settle(song)
+        with wins_lock:
+            wins[('fallback' if query.fallback else 'title') if complete else 'none'] += 1
+        self.i = MAX
+        self.send(SUCCESS if complete else FAILURE)
+        return complete
+
+    def speculate(self, song, query):
+        # Only a confident page counts as a win, doubtful ones are settled by the race
+        try:
+            return self.process_request(song, query)
+        except Cancelled:
+            return False
+
+    def process_request(self, song, query):
+        title = query.title
+        if network.known_miss(title):
+            self.send('Known miss')
+            return False
+        pages = network.request_wiki_page(title)
+        self.advance()
+        if pages:
+            if len(pages) == 1:
+                self.step('Scraping')
+                scrape = self.scrape(song, pages[0], query)
+                self.advance()
+                return scrape
+            elif network.PARALLEL_FILTERS:
+                self.step('Filter (top {})'.format(network.TOP_K))
+                page = network.top_k_filter(pages, query.artist)
+                self.advance()
+                if page:
+                    self.step('Scraping')
+                    scrape = self.scrape(song, page, query)
+                    self.advance()
+                    return scrape
+            else:
+                self.step('Filter (artist)')
+                page = network.similarity_threshold_filter(pages, query.artist)
+                self.advance()
+                if page:
+                    self.step('Scraping')
+                    scrape = self.scrape(song, page, query)
+                    self.advance()
+                    if not scrape:
+                        self.step('Filter (song)')
+                        page = network.perfect_match_filter(pages, '(song)')
+                        self.advance()
+                        if page:
+                            self.step('Scraping')
+                            scrape = self.scrape(song, page, query)
+                            self.advance()
+                            return scrape
+                    return scrape
+                else:
+                    self.step('Filter (song)')
+                    page = network.perfect_match_filter(pages, '(song)')
+                    self.advance()
+                    if page:
+                        self.step('Scraping')
+                        scrape = self.scrape(song, page, query)
+                        self.advance()
+                        return scrape
+        return False
+    # endregion
+
+    # region Methods
+    def when_covered(self, callback):
+        if self.covers:
+            self.covers[-1].add_done_callback(lambda future: callback())
+        else:
+            callback()
+    # endregion
+
+    # region Properties
+    @property
+    def i(self):
+        return self.__i
+
+    @i.setter
+    def i(self, value):
+        self.__progress(value - self.__i)
+        self.__i = value % MAX
+    # endregion
+
+    # region Helpers
+    def advance(self):
+        # Keep the final jump to MAX for the end of the run
+        if self.i < MAX - 1:
+            self.i += 1
+
+    def __relay_send(self, item, status):
+        if not self.__decided.is_set():
+            self.send(status)
+
+    def __relay_progress(self, value):
+        if not self.__decided.is_set():
+            with self.__lock:
+                self.i = min(self.i + value, MAX - 1)
+
+    def scrape(self, song, page, query):
+        prefetched = network.prefetch_cover(page)
+        metadata = network.collect_metadata(page)
+        if not metadata:
+            # Wrong page
+            return False
+
+        accepted, score, self.tentative = network.weigh(metadata, query, prefetched, self.tentative)
+        if not accepted:
+            # Not convincingly this song, escalate to the rest of the cascade
+            self.send('Confidence {:.2f}'.format(score))
+            return False
+
+        network.apply_metadata(song, metadata, prefetched, self.covers)
+        return True
+
+    def settle(self, song):
+        tentative = network.settle(self.tentative)
+        if not tentative:
+            return False
+        if tentative.query in self.queries:
+            planner.record(self.queries, tentative.query, True)
+        network.apply_metadata(song, tentative.metadata, tentative.prefetched, self.covers)
+        return True
+
+    def step(self, status):
+        if self.cancelled.is_set():
+            raise Cancelled()
+        deadline.check()
+        self.send(status)
+
+    def send(self, status):
+        self.__send(self.item, status)
+    # endregion
+
+    pass
+
+
+def stats():
+    with wins_lock:
+        return {'wins': dict(wins), 'confidence': network.confidence_stats()}
@@ -0,0 +1,74 @@
+import hashlib
+import threading
+import weakref
+from wikimusic import cache, model
+
+# region Constants
+TTL = 60 * 60 * 24 * 365
+MAX_SIZE = 512 * 1024 * 1024
+# endregion
+
+
+class CoverStore(object):
+    def __init__(self, ttl=TTL, max_size=MAX_SIZE):
+        self.hits = 0
+        self.stored = 0
+        self.__urls = cache.DiskCache('cover_urls', ttl=ttl)
+        self.__blobs = cache.DiskCache('cover_blobs', max_size=max_size, ttl=ttl)
+        self.__covers = weakref.WeakValueDictionary()
+        self.__lock = threading.Lock()
+
+    # region Methods
+    def get(self, url):
+        entry = self.__urls.get(url)
+        if entry:
+            cover = self.load(*entry)
+            if cover:
+                self.hits += 1
+                return cover
+
+    def put(self, url, data, mime):
+        digest = hashlib.sha256(data).hexdigest()
+        if digest not in self.__blobs:
+            self.__blobs.set(digest, data)
+            self.stored += 1
+        self.__urls.set(url, (digest, mime))
+        return self.__share(digest, data, mime)
+
+    def load(self, digest, mime):
+        with self.__lock:
+            cover = self.__covers.get(digest)
+        if cover:
+            return cover
+        data = self.__blobs.get(digest)
+        if data:
+            return self.__share(digest, data, mime)
+
+    def flush(self):
+        self.__urls.flush()
+        self.__blobs.flush()
+
+    # endregion
+
+    # region Properties
+    @property
+    def stats(self):
+        return {'hits': self.hits, 'stored': self.stored, 'shared': len(self.__covers)}
+
+    # endregion
+
+    # region Helpers
+    def __share(self, digest, data, mime):
+        # Every song showing this image holds the same Cover and therefore the same bytes
+        with self.__lock:
+            cover = self.__covers.get(digest)
+            if not cover:
+                cover = model.Cover(data, mime)
+                self.__covers[digest] = cover
+            return cover
+
+    # endregion
+    pass
+
+
+store = CoverStore()
@@ -0,0 +1,75 @@
+import threading
+from contextlib import contextmanager
+from time import time
+import requests
+
+# region Constants
+ITEM_BUDGET = 60.0
+JOB_DEADLINE = None
+# endregion
+
+local = threading.local()
+job = None
+
+
+class DeadlineExceeded(requests.Timeout):
+    pass
+
+
+class Deadline(object):
+    def __init__(self, at):
+        self.at = at
+
+    @property
+    def remaining(self):
+        return self.at - time()
+
+    @property
+    def expired(self):
+        return self.remaining <= 0
+
+
+def start_job(seconds=JOB_DEADLINE):
+    global job
+    job = time() + seconds if seconds else None
+
+
+def for_item(budget=ITEM_BUDGET):
+    at = time() + budget if budget else float('inf')
+    return Deadline(min(at, job) if job else at)
+
+
+@contextmanager
+def scope(deadline):
+    previous = current()
+    local.deadline = deadline
+    try:
+        yield deadline
+    finally:
+        local.deadline = previous
+
+
+def wrap(fn):
+    # Carry the caller's deadline into another thread
+    budget = current()
+
+    def run(*args):
+        with scope(budget):
+            return fn(*args)
+    return run
+
+
+def current():
+    return getattr(local, 'deadline', None)
+
+
+def remaining():
+    deadline = current()
+    if deadline and deadline.at != float('inf'):
+        return max(0.0, deadline.remaining)
+
+
+def check():
+    deadline = current()
+    if deadline and deadline.expired:
+        raise DeadlineExceeded('Deadline exceeded')
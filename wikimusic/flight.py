@@ -0,0 +1,70 @@
+import threading
+from concurrent.futures import Future, TimeoutError
+from wikimusic import deadline
+
+
+class SingleFlight(object):
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self.retried = 0
+        self.__flights = {}
+        self.__lock = threading.Lock()
+
+    def do(self, key, fn, *args):
+        with self.__lock:
+            self.calls += 1
+        while True:
+            with self.__lock:
+                flight = self.__flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self.__flights[key] = Future()
+                else:
+                    self.shared += 1
+
+            if leader:
+                return self.__lead(key, flight, fn, *args)
+
+            # Identical call already in flight, wait for its result instead of repeating it
+            try:
+                return flight.result(timeout=deadline.remaining())
+            except TimeoutError:
+                raise deadline.DeadlineExceeded('Deadline exceeded waiting for {}'.format(key))
+            except deadline.DeadlineExceeded:
+                # The leader ran out of its own budget, try again if ours is not spent
+                deadline.check()
+                with self.__lock:
+                    self.retried += 1
+
+    def __lead(self, key, flight, fn, *args):
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            self.__land(key)
+            flight.set_exception(e)
+            raise
+        else:
+            self.__land(key)
+            flight.set_result(result)
+            return result
+
+    def __land(self, key):
+        # Gone before followers wake up, so a retrying follower starts a new flight
+        with self.__lock:
+            del self.__flights[key]
+
+    @property
+    def stats(self):
+        return {'calls': self.calls, 'shared': self.shared, 'retried': self.retried}
+
+
+flights = SingleFlight()
+
+
+def do(key, fn, *args):
+    return flights.do(key, fn, *args)
+
+
+def stats():
+    return flights.stats
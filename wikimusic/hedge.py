@@ -0,0 +1,109 @@
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError
+from time import time
+from wikimusic import deadline
+
+# region Constants
+ENABLED = False
+PERCENTILE = 0.95
+SAMPLES = 200
+MIN_SAMPLES = 20
+MAX_RATE = 0.1
+WORKERS = 64
+# endregion
+
+executor = ThreadPoolExecutor(max_workers=WORKERS)
+
+
+class Hedger(object):
+    def __init__(self, name, percentile=PERCENTILE, max_rate=MAX_RATE):
+        self.name = name
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.calls = 0
+        self.hedges = 0
+        self.won = 0
+        self.__samples = collections.deque(maxlen=SAMPLES)
+        self.__lock = threading.Lock()
+
+    # region Methods
+    def call(self, fn, *args):
+        with self.__lock:
+            self.calls += 1
+        threshold = self.threshold
+        budget = deadline.current()
+        if not ENABLED or threshold is None:
+            return self.__timed(budget, fn, *args)
+
+        primary = executor.submit(self.__timed, budget, fn, *args)
+        try:
+            return primary.result(timeout=threshold)
+        except TimeoutError:
+            pass
+        with self.__lock:
+            if self.hedges >= self.calls * self.max_rate:
+                hedged = False
+            else:
+                hedged = True
+                self.hedges += 1
+        if not hedged:
+            return primary.result()
+
+        # Whichever answers first wins, the other one is left to finish in the background
+        secondary = executor.submit(self.__timed, budget, fn, *args)
+        pending = {primary, secondary}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winners = [f for f in done if not f.exception()]
+            if winners or not pending:
+                future = (winners or list(done))[0]
+                if future is secondary:
+                    with self.__lock:
+                        self.won += 1
+                return future.result()
+
+    # endregion
+
+    # region Properties
+    @property
+    def threshold(self):
+        with self.__lock:
+            if len(self.__samples) < MIN_SAMPLES:
+                return
+            samples = sorted(self.__samples)
+        return samples[min(len(samples) - 1, int(len(samples) * self.percentile))]
+
+    @property
+    def stats(self):
+        return {'calls': self.calls, 'hedges': self.hedges, 'won': self.won, 'p95': self.threshold}
+
+    # endregion
+
+    # region Helpers
+    def __timed(self, budget, fn, *args):
+        # Executor threads do not inherit the caller's deadline
+        start = time()
+        with deadline.scope(budget):
+            result = fn(*args)
+        with self.__lock:
+            self.__samples.append(time() - start)
+        return result
+
+    # endregion
+    pass
+
+
+hedgers = {}
+lock = threading.Lock()
+
+
+def call(name, fn, *args):
+    with lock:
+        if name not in hedgers:
+            hedgers[name] = Hedger(name)
+    return hedgers[name].call(fn, *args)
+
+
+def stats():
+    return {name: hedger.stats for name, hedger in hedgers.items()}
@@ -0,0 +1,152 @@
+import threading
+from email.utils import parsedate_to_datetime
+from time import time, sleep
+from wikimusic import deadline
+
+# region Constants
+RATE = 20.0
+BURST = 10
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 10
+INITIAL_CONCURRENCY = 4
+INCREASE = 1.0
+DECREASE = 0.5
+RETRY_AFTER = 1.0
+MAX_RETRY_AFTER = 60.0
+# endregion
+
+
+class TokenBucket(object):
+    def __init__(self, rate=RATE, capacity=BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.__tokens = float(capacity)
+        self.__updated = time()
+        self.__lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.__lock:
+                now = time()
+                self.__tokens = min(self.capacity, self.__tokens + (now - self.__updated) * self.rate)
+                self.__updated = now
+                if self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return
+                wait = (1 - self.__tokens) / self.rate
+            sleep(budget(wait))
+
+
+class AdaptiveLimiter(object):
+    def __init__(self, rate=RATE, burst=BURST, concurrency=INITIAL_CONCURRENCY,
+                 minimum=MIN_CONCURRENCY, maximum=MAX_CONCURRENCY):
+        self.bucket = TokenBucket(rate, burst)
+        self.limit = float(concurrency)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.active = 0
+        self.requests = 0
+        self.throttled = 0
+        self.failed = 0
+        self.__paused_until = 0
+        self.__condition = threading.Condition()
+
+    # region Methods
+    def acquire(self):
+        with self.__condition:
+            while True:
+                pause = self.__paused_until - time()
+                if pause > 0:
+                    self.__condition.wait(budget(pause))
+                elif self.active >= int(self.limit):
+                    self.__condition.wait(budget())
+                else:
+                    break
+            self.active += 1
+        try:
+            self.bucket.acquire()
+        except deadline.DeadlineExceeded:
+            self.cancel()
+            raise
+
+    def release(self, retry_after=None, failed=False):
+        with self.__condition:
+            self.active -= 1
+            self.requests += 1
+            if failed:
+                # Errors shrink the window like throttling does, without pausing the host
+                self.failed += 1
+                self.limit = max(self.minimum, self.limit * DECREASE)
+            elif retry_after is None:
+                # Additive increase, roughly one slot per window of successful requests
+                self.limit = min(self.maximum, self.limit + INCREASE / self.limit)
+            else:
+                # Multiplicative decrease and a shared pause for everyone on this host
+                self.throttled += 1
+                self.limit = max(self.minimum, self.limit * DECREASE)
+                self.__paused_until = max(self.__paused_until, time() + retry_after)
+            self.__condition.notify_all()
+
+    def cancel(self):
+        # The slot is given back without judging the host, e.g. when the caller ran out of time
+        with self.__condition:
+            self.active -= 1
+            self.__condition.notify_all()
+
+    # endregion
+
+    # region Properties
+    @property
+    def stats(self):
+        return {
+            'limit': int(self.limit),
+            'active': self.active,
+            'requests': self.requests,
+            'throttled': self.throttled,
+            'failed': self.failed,
+        }
+
+    # endregion
+    pass
+
+
+limiters = {}
+lock = threading.Lock()
+
+
+def get(host):
+    with lock:
+        if host not in limiters:
+            limiters[host] = AdaptiveLimiter()
+        return limiters[host]
+
+
+def stats():
+    return {host: limiter.stats for host, limiter in limiters.items()}
+
+
+def budget(wait=None):
+    # Waits for a slot, a token or a pause are cut to what is left of the item's deadline
+    remaining = deadline.remaining()
+    if remaining is None:
+        return wait
+    if remaining <= 0 or wait is not None and wait > remaining:
+        raise deadline.DeadlineExceeded('Deadline exceeded waiting for the limiter')
+    return remaining if wait is None else wait
+
+
+def retry_after(response):
+    # 429 / 503 and MediaWiki maxlag errors all ask the client to back off
+    if response.status_code not in (429, 503) and response.headers.get('MediaWiki-API-Error') != 'maxlag':
+        return
+    value = response.headers.get('Retry-After')
+    if not value:
+        return RETRY_AFTER
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            delay = parsedate_to_datetime(value).timestamp() - time()
+        except (TypeError, ValueError):
+            delay = RETRY_AFTER
+    return min(MAX_RETRY_AFTER, max(0.0, delay))
@@ -0,0 +1,184 @@
+import re
+import math
+import difflib
+import collections
+import functools
+from time import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# region Constants
+CACHE_SIZE = 65536
+WORD = re.compile(r'\w+')
+BACKEND = 'lcs'
+NGRAM = 3
+# endregion
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def tokens(value):
+    return tuple(WORD.findall(value.casefold()))
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def normalize(value):
+    return ' '.join(tokens(value))
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def token_set(value):
+    return frozenset(tokens(value))
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def masks(value):
+    # Bit i of masks[c] is set where value[i] == c
+    result = {}
+    for i, c in enumerate(value):
+        result[c] = result.get(c, 0) | 1 << i
+    return result
+
+
+def lcs(value, value2):
+    # Bit-parallel LCS length (Hyyro), one big-int step per character of value2
+    if not value or not value2:
+        return 0
+    peq = masks(value)
+    full = (1 << len(value)) - 1
+    v = full
+    for c in value2:
+        u = v & peq.get(c, 0)
+        v = ((v + u) | (v - u)) & full
+    return len(value) - bin(v).count('1')
+
+
+def ratio(value, value2):
+    total = len(value) + len(value2)
+    return 2.0 * lcs(value, value2) / total if total else 1.0
+
+
+def token_set_ratio(value, value2):
+    a, b = token_set(value), token_set(value2)
+    common = ' '.join(sorted(a & b))
+    rest = ' '.join(sorted(a - b))
+    rest2 = ' '.join(sorted(b - a))
+    # Shared words first, a lone shared word does not make a subset a perfect match
+    return ratio(' '.join(filter(None, (common, rest))), ' '.join(filter(None, (common, rest2))))
+
+
+def similarity(value, query):
+    # Case, punctuation and word order do not matter, masks are built once per query
+    if token_set(value) == token_set(query):
+        return 1.0
+    return max(ratio(normalize(query), normalize(value)), token_set_ratio(query, value))
+
+
+def rank(query, choices, key=None):
+    # Scores a whole list at once, best first, ties keep the order of choices
+    if BACKEND == 'ngram' and numpy is not None:
+        return ngram_rank(query, choices, key)
+    scored = []
+    for choice in choices:
+        value = key(choice) if key else choice
+        if value:
+            scored.append((similarity(value, query), choice))
+    scored.sort(key=lambda s: s[0], reverse=True)
+    return scored
+
+
+# region N-grams
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def ngrams(value):
+    padded = ' {} '.format(normalize(value))
+    return tuple(padded[i:i + NGRAM] for i in range(max(1, len(padded) - NGRAM + 1)))
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def ngram_norm(value):
+    counts = collections.Counter(ngrams(value))
+    return math.sqrt(sum(c * c for c in counts.values()))
+
+
+def ngram_vectors(values, vocabulary):
+    # N-gram counts over the vocabulary, scaled by each value's full norm so a dot product is the cosine
+    rows, columns = [], []
+    for row, value in enumerate(values):
+        for gram in ngrams(value):
+            column = vocabulary.get(gram)
+            if column is not None:
+                rows.append(row)
+                columns.append(column)
+    cells = numpy.asarray(rows, dtype=numpy.int64) * len(vocabulary) + numpy.asarray(columns, dtype=numpy.int64)
+    matrix = numpy.bincount(cells, minlength=len(values) * len(vocabulary)).astype(numpy.float32)
+    matrix = matrix.reshape(len(values), len(vocabulary))
+    norms = numpy.array([ngram_norm(value) for value in values], dtype=numpy.float32)[:, None]
+    return numpy.divide(matrix, norms, out=numpy.zeros_like(matrix), where=norms > 0)
+
+
+def cosine_matrix(values, values2):
+    # Every value against every value2 in a single matrix product, only grams of values can contribute
+    vocabulary = {}
+    for value in values:
+        for gram in ngrams(value):
+            vocabulary.setdefault(gram, len(vocabulary))
+    return ngram_vectors(values, vocabulary) @ ngram_vectors(values2, vocabulary).T
+
+
+def ngram_rank(query, choices, key=None):
+    choices = [choice for choice in choices if (key(choice) if key else choice)]
+    if not choices:
+        return []
+    scores = cosine_matrix([query], [key(choice) if key else choice for choice in choices])[0]
+    order = numpy.argsort(-scores, kind='stable')
+    return [(float(scores[i]), choices[i]) for i in order]
+
+# endregion
+
+
+def clear():
+    for fn in (tokens, normalize, token_set, masks, ngrams, ngram_norm):
+        fn.cache_clear()
+
+
+# region Benchmark
+def benchmark(options=500, repeat=20):
+    artists = ['Lou Reed', 'Duran Duran', 'Patti Smith', 'Kirsty MacColl', 'The Triffids', 'Sonic Youth']
+    choices = ['{} {}'.format(artists[i % len(artists)], i) for i in range(options)]
+    query = 'Lou Reed'
+
+    start = time()
+    for _ in range(repeat):
+        expected = sorted(((difflib.SequenceMatcher(lambda x: x == ' ', c, query).ratio(), c) for c in choices),
+                          key=lambda s: s[0], reverse=True)
+    baseline = (time() - start) / repeat
+
+    clear()
+    start = time()
+    ranked = rank(query, choices)
+    cold = time() - start
+
+    start = time()
+    for _ in range(repeat):
+        ranked = rank(query, choices)
+    warm = (time() - start) / repeat
+
+    print('{} options, difflib {:.2f}ms, match {:.2f}ms cold ({:.1f}x), {:.2f}ms cached ({:.1f}x)'.format(
+        options, baseline * 1000, cold * 1000, baseline / cold, warm * 1000, baseline / warm))
+    print('difflib best: {}, match best: {}'.format(expected[0][1], ranked[0][1]))
+
+    if numpy is not None:
+        start = time()
+        for _ in range(repeat):
+            ranked = ngram_rank(query, choices)
+        vectorized = (time() - start) / repeat
+        print('  ngram {:.2f}ms ({:.1f}x), best: {}'.format(vectorized * 1000, baseline / vectorized, ranked[0][1]))
+
+# endregion
+
+
+if __name__ == '__main__':
+    for n in (50, 500, 5000):
+        benchmark(n)
@@ -0,0 +1,137 @@
+import requests
+from wikimusic import pool
+
+# region Constants
+API = 'https://en.wikipedia.org/w/api.php'
+BATCH = 50
+MAXLAG = 5
+THUMBNAIL_WIDTH = 300
+# endregion
+
+# Lead image of every resolved page, non-free album covers included
+IMAGE_PARAMS = {'piprop': 'thumbnail', 'pithumbsize': THUMBNAIL_WIDTH, 'pilicense': 'any', 'pilimit': BATCH}
+
+
+class MediaWikiError(Exception):
+    pass
+
+
+class Page(object):
+    def __init__(self, title, pageid, revid=None, image=None):
+        self.title = title
+        self.pageid = pageid
+        self.revid = revid
+        self.image = image
+
+    def __repr__(self):
+        return 'Page({!r}, {}, {})'.format(self.title, self.pageid, self.revid)
+
+
+class Disambiguation(object):
+    # Placeholder for a disambiguation page whose options are still to be fetched
+    def __init__(self, title):
+        self.title = title
+
+    def __repr__(self):
+        return 'Disambiguation({!r})'.format(self.title)
+
+
+# region Requests
+def resolve(title, suggest=True):
+    # Title, redirect target, revision and disambiguation status in a single request
+    params = dict(IMAGE_PARAMS, action='query', redirects=1, prop='info|pageprops|pageimages',
+                  ppprop='disambiguation')
+    if suggest:
+        params.update(generator='search', gsrsearch=title, gsrlimit=1)
+    else:
+        params['titles'] = title
+    response = query(params)
+    pages = response.get('query', {}).get('pages', [])
+    return to_result(pages[0]) if pages else None
+
+
+def resolve_many(titles, expand=True):
+    # Up to BATCH exact titles per request, following normalization and redirects back to each input title
+    response = query(dict(IMAGE_PARAMS, action='query', titles='|'.join(titles), redirects=1,
+                          prop='info|pageprops|pageimages', ppprop='disambiguation'))
+    data = response.get('query', {})
+    aliases = {m['from']: m['to'] for m in data.get('normalized', []) + data.get('redirects', [])}
+    pages = {p['title']: p for p in data.get('pages', [])}
+    results = {}
+    for title in titles:
+        target = title
+        seen = set()
+        while target in aliases and target not in seen:
+            seen.add(target)
+            target = aliases[target]
+        page = pages.get(target)
+        results[title] = to_result(page, expand) if page else None
+    return results
+
+
+def links(title):
+    return links_many([title]).get(title, [])
+
+
+def links_many(titles):
+    # Options of several disambiguation pages at once, the link limit is shared so follow continuations
+    options = {title: [] for title in titles}
+    params = {'action': 'query', 'titles': '|'.join(titles), 'prop': 'links', 'plnamespace': 0, 'pllimit': 'max'}
+    while True:
+        response = query(params)
+        for page in response.get('query', {}).get('pages', []):
+            options.setdefault(page['title'], []).extend(link['title'] for link in page.get('links', []))
+        if 'continue' not in response:
+            return options
+        params.update(response['continue'])
+
+
+def html(page, section=None):
+    params = {'action': 'parse', 'prop': 'text', 'disablelimitreport': 1, 'disableeditsection': 1}
+    if page.revid:
+        params['oldid'] = page.revid
+    else:
+        params['pageid'] = page.pageid
+    if section is not None:
+        params['section'] = section
+    return query(params).get('parse', {}).get('text', '')
+
+
+def page_images(titles):
+    response = query(dict(IMAGE_PARAMS, action='query', titles='|'.join(titles), prop='pageimages'))
+    return {p['title']: image_url(p) for p in response.get('query', {}).get('pages', []) if 'pageid' in p}
+
+
+def latest_revisions(titles):
+    response = query({'action': 'query', 'prop': 'info', 'titles': '|'.join(titles)})
+    return {p['title']: p['lastrevid'] for p in response.get('query', {}).get('pages', []) if 'lastrevid' in p}
+
+# endregion
+
+
+# region Helper
+def to_result(page, expand=True):
+    if page.get('missing') or page.get('invalid'):
+        return
+    if 'disambiguation' in page.get('pageprops', {}):
+        return links(page['title']) if expand else Disambiguation(page['title'])
+    return Page(page['title'], page['pageid'], page.get('lastrevid'), image_url(page))
+
+
+def image_url(page):
+    return page.get('thumbnail', {}).get('source', '')
+
+
+def query(params):
+    params = dict(params, format='json', formatversion=2, maxlag=MAXLAG)
+    try:
+        response = pool.get(API, params=params)
+        response.raise_for_status()
+        data = response.json()
+    except (requests.RequestException, ValueError) as e:
+        raise MediaWikiError(e)
+    if 'error' in data:
+        raise MediaWikiError(data['error'].get('info'))
+    return data
+
+# endregion
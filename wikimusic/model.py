@@ -1,3 +1,4 @@
+import json
 import mutagen
 from mutagen import mp3, id3
 from wikimusic import util
@@ -74,6 +75,12 @@ class Song(object):
         except mutagen.MutagenError:
             return False
 
+    def copy_collected(self, song):
+        self.album = song.album
+        self.release = song.release
+        self.genres = song.genres
+        self.cover = song.cover
+
     def verbose_print(self):
         print('*****\n' + self.__audio.pprint())
 
@@ -82,3 +89,29 @@ class Cover(object):
     def __init__(self, data, mime):
         self.data = data
         self.mime = mime
+
+
+class Metadata(object):
+    def __init__(self, album=None, release=None, genres=None, cover_url=None, title=None, artist=None):
+        self.album = album
+        self.release = release
+        self.genres = genres
+        self.cover_url = cover_url
+        self.title = title
+        self.artist = artist
+
+    def apply(self, song):
+        if self.album:
+            song.album = self.album
+        if self.release:
+            song.release = self.release
+        if self.genres:
+            song.genres = self.genres
+
+    def pack(self):
+        return json.dumps([self.album, self.release, self.genres, self.cover_url, self.title, self.artist],
+                          separators=(',', ':'))
+
+    @classmethod
+    def unpack(cls, data):
+        return cls(*json.loads(data))
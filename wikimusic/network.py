@@ -1,62 +1,529 @@
-import urllib.request
-import urllib.error
-import urllib.parse
-import warnings
-import wikipedia
+import re
+import threading
+import collections
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from time import sleep
+import requests
 from bs4 import BeautifulSoup
-from wikimusic import model, util, debug
-
-# Suppress warnings that come with wikipedia library
-warnings.filterwarnings("ignore")
+from wikimusic import model, util, debug, cache, mediawiki, pool, hedge, deadline, flight, covers, match, planner
 
 THRESHOLD = 0.75
+MISS_TTL = 60 * 60 * 24
+WINDOW = 0.05
+LEAD_SECTION = True
+COVER_WIDTH = mediawiki.THUMBNAIL_WIDTH
+COVER_WORKERS = 10
+MAX_COVER_BYTES = 1024 * 1024
+CHUNK_SIZE = 16 * 1024
+PARALLEL_FILTERS = False
+TOP_K = 3
+CANDIDATE_WORKERS = 32
+EXPAND_WORKERS = 4
+HIGH_CONFIDENCE = 0.8
+LOW_CONFIDENCE = 0.4
+BY = re.compile(r'\b(?:single|song|track)\b.*?\bby\s+(.+)$', re.IGNORECASE)
 
+# region Batching
+class BatchResolver(object):
+    def __init__(self, window=WINDOW, size=mediawiki.BATCH):
+        self.window = window
+        self.size = size
+        self.requests = 0
+        self.resolved = 0
+        self.__pending = collections.OrderedDict()
+        self.__condition = threading.Condition()
+        self.__thread = None
+        self.__expander = ThreadPoolExecutor(max_workers=EXPAND_WORKERS)
 
-def request_wiki_page(title):
+    # region Methods
+    def submit(self, title, urgent=False):
+        key = util.normalize_title(title)
+        with self.__condition:
+            if key in self.__pending:
+                if urgent:
+                    self.__pending.move_to_end(key, last=False)
+                return self.__pending[key][1]
+            future = Future()
+            self.__pending[key] = (title, future)
+            if urgent:
+                self.__pending.move_to_end(key, last=False)
+            if not self.__thread:
+                self.__thread = threading.Thread(target=self.__run, daemon=True)
+                self.__thread.start()
+            self.__condition.notify()
+            return future
+
+    def resolve(self, title):
+        if '|' in title:
+            return
+        # A collector is blocked on this title, resolve it ahead of prefetched ones
+        try:
+            return self.submit(title, urgent=True).result(timeout=deadline.remaining())
+        except TimeoutError:
+            raise deadline.DeadlineExceeded('Deadline exceeded waiting for batch')
+
+    # endregion
+
+    # region Helpers
+    def __run(self):
+        while True:
+            with self.__condition:
+                while not self.__pending:
+                    self.__condition.wait()
+                full = len(self.__pending) >= self.size
+            if not full:
+                # Give other collectors the chance to join this batch
+                sleep(self.window)
+            with self.__condition:
+                batch = [self.__pending.popitem(last=False) for _ in range(min(self.size, len(self.__pending)))]
+            try:
+                results = mediawiki.resolve_many([title for _, (title, _) in batch], expand=False)
+            except Exception as e:
+                # Whatever went wrong, this thread has to survive to serve the next batch
+                e = e if isinstance(e, mediawiki.MediaWikiError) else mediawiki.MediaWikiError(e)
+                for _, (_, future) in batch:
+                    future.set_exception(e)
+                continue
+            self.requests += 1
+            self.resolved += len(batch)
+            ambiguous = {}
+            for _, (title, future) in batch:
+                result = results.get(title)
+                if isinstance(result, mediawiki.Disambiguation):
+                    ambiguous.setdefault(result.title, []).append(future)
+                else:
+                    future.set_result(result)
+            if ambiguous:
+                # Options are fetched aside, plain pages in this batch are not held up by them
+                self.__expander.submit(self.__expand, ambiguous)
+
+    def __expand(self, ambiguous):
+        try:
+            options = mediawiki.links_many(list(ambiguous))
+        except Exception as e:
+            e = e if isinstance(e, mediawiki.MediaWikiError) else mediawiki.MediaWikiError(e)
+            for futures in ambiguous.values():
+                for future in futures:
+                    future.set_exception(e)
+            return
+        for title, futures in ambiguous.items():
+            for future in futures:
+                future.set_result(options.get(title, []))
+
+    # endregion
+    pass
+
+
+resolver = BatchResolver()
+cover_executor = ThreadPoolExecutor(max_workers=COVER_WORKERS)
+# Deferred covers wait on prefetched downloads, keep them off the download workers
+deferred_executor = ThreadPoolExecutor(max_workers=COVER_WORKERS)
+candidate_executor = ThreadPoolExecutor(max_workers=CANDIDATE_WORKERS)
+
+# endregion
+
+
+# region Cache
+page_cache = cache.DiskCache('pages')
+html_cache = cache.DiskCache('html')
+metadata_cache = cache.DiskCache('metadata')
+option_cache = cache.DiskCache('options')
+miss_cache = cache.DiskCache('misses', ttl=MISS_TTL)
+miss_filter = None
+miss_lock = threading.Lock()
+
+
+def lookup(title):
+    found, result = cached_lookup(title)
+    if found:
+        return result
+    return flight.do('lookup:{}'.format(util.normalize_title(title)), resolve_lookup, title)
+
+
+def resolve_lookup(title):
     try:
-        return [wikipedia.page(title=title)]
-    except wikipedia.exceptions.DisambiguationError as e:
-        return e.options
-    except wikipedia.exceptions.PageError:
+        result = resolver.resolve(title)
+        if result is None:
+            # Not an exact title, let search suggest one
+            result = hedge.call('lookup', mediawiki.resolve, title)
+    except mediawiki.MediaWikiError as e:
+        print(e)
         return
+    store_lookup(title, result)
+    return result
+
+
+def cached_lookup(title):
+    key = util.normalize_title(title)
+    if known_miss(title):
+        return True, None
+    options = option_cache.get(key)
+    if options is not None:
+        return True, options
+    page = page_cache.get(key)
+    if page:
+        return True, page
+    return False, None
+
+
+def store_lookup(title, result):
+    key = util.normalize_title(title)
+    if isinstance(result, mediawiki.Page):
+        page_cache.set(key, result)
+    elif result is not None:
+        option_cache.set(key, result)
+    else:
+        remember_miss(title)
+
+
+def prefetch(titles):
+    imageless = {}
+    for title in titles:
+        if not title or '|' in title:
+            continue
+        found, result = cached_lookup(title)
+        if not found:
+            resolver.submit(title).add_done_callback(lambda f, t=title: prefetched(t, f))
+        elif isinstance(result, mediawiki.Page) and lead_image(result) is None:
+            imageless[util.normalize_title(title)] = result
+    if imageless:
+        threading.Thread(target=prefetch_images, args=(imageless,), daemon=True).start()
+
+
+def prefetched(title, future):
+    if not future.exception() and future.result() is not None:
+        store_lookup(title, future.result())
+
+
+def prefetch_images(pages):
+    # Pages cached before lead images were requested, fill them in 50 at a time
+    items = list(pages.items())
+    for i in range(0, len(items), mediawiki.BATCH):
+        batch = items[i:i + mediawiki.BATCH]
+        try:
+            images = mediawiki.page_images([page.title for _, page in batch])
+        except mediawiki.MediaWikiError as e:
+            print(e)
+            continue
+        for key, page in batch:
+            page.image = images.get(page.title, '')
+            page_cache.set(key, page)
+
+
+def wiki_page(title):
+    result = lookup(title)
+    if isinstance(result, mediawiki.Page):
+        return result
+
+
+def page_html(page, section=None):
+    key = html_key(page, section)
+    html = html_cache.get(key)
+    if html is None:
+        html = flight.do('html:{}'.format(key), fetch_html, page, section)
+    return html
+
+
+def fetch_html(page, section=None):
+    html = hedge.call('html', mediawiki.html, page, section)
+    html_cache.set(html_key(page, section), html)
+    return html
+
+
+def known_miss(title):
+    key = util.normalize_title(title)
+    return key in misses() and key in miss_cache
+
+
+def remember_miss(title):
+    key = util.normalize_title(title)
+    miss_cache.set(key, True)
+    misses().add(key)
+
+
+def misses():
+    global miss_filter
+    with miss_lock:
+        if miss_filter is None:
+            miss_filter = cache.BloomFilter()
+            miss_filter.update(miss_cache.keys())
+        return miss_filter
+
+
+def revalidate_cache():
+    pages = {}
+    for key, page in page_cache.items():
+        pages.setdefault(page.title, []).append((key, page))
+
+    invalidated = 0
+    titles = list(pages)
+    for i in range(0, len(titles), mediawiki.BATCH):
+        batch = titles[i:i + mediawiki.BATCH]
+        try:
+            revisions = mediawiki.latest_revisions(batch)
+        except mediawiki.MediaWikiError as e:
+            print(e)
+            continue
+        for title in batch:
+            for key, page in pages[title]:
+                if revisions.get(title) != page.revid:
+                    page_cache.delete(key)
+                    html_cache.delete(html_key(page))
+                    html_cache.delete(html_key(page, 0))
+                    metadata_cache.delete(metadata_key(page))
+                    invalidated += 1
+    debug.log('Revalidated {} page(s), {} invalidated'.format(len(titles), invalidated))
+    return invalidated
+
+
+def metadata_key(page):
+    return '{}:{}'.format(page.pageid, page.revid)
+
+
+def html_key(page, section=None):
+    key = util.normalize_title(page.title)
+    return key if section is None else '{}#{}'.format(key, section)
+
+
+def cache_stats():
+    stats = {c.name: c.stats for c in (page_cache, html_cache, metadata_cache, option_cache, miss_cache)}
+    stats['single_flight'] = flight.stats()
+    stats['covers'] = covers.store.stats
+    return stats
+
+
+def flush_caches():
+    # Access times are written in batches, the last one would otherwise be lost
+    for c in (page_cache, html_cache, metadata_cache, option_cache, miss_cache):
+        c.flush()
+    covers.store.flush()
+
+# endregion
+
+
+def request_wiki_page(title):
+    result = lookup(title)
+    return [result] if isinstance(result, mediawiki.Page) else result
 
 
 def similarity_threshold_filter(options, find):
     debug.log('\n#### FILTER ####\n')
-    for o in options:
-        c = util.parenthesis_content(o)
-        if c:
-            debug.log('{} --> {}'.format(o, c))
-            s = ' '.join(w for w in c.split() if w[0].isupper())
-            if s:
-                r = util.similarity(s, find)
-                debug.log('  {}: {:.2f}'.format(s, r))
-                if r >= THRESHOLD:
-                    try:
-                        return wikipedia.page(title=o.translate({ord(i): None for i in '"?!'}))
-                    except (wikipedia.exceptions.DisambiguationError, wikipedia.exceptions.PageError):
-                        debug.log("[EXCEPTION] Filtered page ({})".format(o))
-                        return
+    ranked = ranked_options(options, find, songs=False)
+    if ranked:
+        page = wiki_page(option_title(ranked[0]))
+        if not page:
+            debug.log("[EXCEPTION] Filtered page ({})".format(ranked[0]))
+        return page
 
 
 def perfect_match_filter(options, find):
     matches = [o for o in options if find in o]
     if len(matches) == 1:
-        try:
-            return wikipedia.page(title=matches[0].translate({ord(i): None for i in '"?!'}))
-        except (wikipedia.exceptions.DisambiguationError, wikipedia.exceptions.PageError):
+        page = wiki_page(option_title(matches[0]))
+        if not page:
             debug.log("[EXCEPTION] Filtered page ({})".format(matches[0]))
-            return
+        return page
 
 
-def scrape_metadata(song, wikipage):
-    html = wikipage.html()
+def top_k_filter(options, find, k=TOP_K):
+    # Both filters in one pass: the best k options are fetched side by side, the best verified infobox wins
+    debug.log('\n#### FILTER (top {}) ####\n'.format(k))
+    candidates = ranked_options(options, find)[:k]
+    futures = [candidate_executor.submit(deadline.wrap(verified_page), o) for o in candidates]
+    for o, future in zip(candidates, futures):
+        try:
+            page = future.result(timeout=deadline.remaining())
+        except TimeoutError:
+            raise deadline.DeadlineExceeded('Deadline exceeded waiting for candidates')
+        if page:
+            return page
+        debug.log("[EXCEPTION] Filtered page ({})".format(o))
+
+
+def ranked_options(options, find, songs=True):
+    ranked = []
+    for r, o in match.rank(find, options, key=option_artist):
+        if r < THRESHOLD:
+            break
+        debug.log('  {}: {:.2f}'.format(o, r))
+        ranked.append(o)
+    # The '(song)' page is what perfect_match_filter would have tried next
+    matches = [o for o in options if '(song)' in o] if songs else []
+    if len(matches) == 1 and matches[0] not in ranked:
+        ranked.append(matches[0])
+    return ranked
+
+
+def verified_page(option):
+    page = wiki_page(option_title(option))
+    if page and collect_metadata(page):
+        return page
+
+
+def option_artist(option):
+    c = util.parenthesis_content(option)
+    if c:
+        return ' '.join(w for w in c.split() if w[0].isupper())
+
+
+def option_title(option):
+    return option.translate({ord(i): None for i in '"?!'})
+
+
+# region Confidence
+class Tentative(object):
+    # A doubtful page kept in case nothing better turns up
+    def __init__(self, score, metadata, prefetched, query):
+        self.score = score
+        self.metadata = metadata
+        self.prefetched = prefetched
+        self.query = query
+
+
+verdicts = collections.Counter()
+verdict_lock = threading.Lock()
+
+
+def weigh(metadata, query, prefetched, tentative=None):
+    # Returns whether to accept the page, its score and the best doubtful page so far
+    score = confidence(metadata, query)
+    if score is None or score >= HIGH_CONFIDENCE:
+        verdict('confident' if score is not None else 'unscored')
+        return True, score, tentative
+    if score < LOW_CONFIDENCE:
+        verdict('rejected')
+        return False, score, tentative
+    verdict('doubtful')
+    if not tentative or score > tentative.score:
+        tentative = Tentative(score, metadata, prefetched, query)
+    return False, score, tentative
+
+
+def settle(tentative):
+    # Nothing convincing turned up, fall back to the best page that was not ruled out
+    if tentative:
+        verdict('settled')
+    return tentative
+
+
+def verdict(name):
+    with verdict_lock:
+        verdicts[name] += 1
+
+
+def confidence_stats():
+    with verdict_lock:
+        return dict(verdicts)
+
+
+def confidence(metadata, query):
+    # How well the infobox matches the song, None for infoboxes parsed before title and artist were kept
+    scores = []
+    if metadata.title:
+        scores.append(match.similarity(metadata.title, query.name))
+    if metadata.artist and query.artist:
+        scores.append(match.similarity(planner.clean(metadata.artist)[0], query.artist))
+    if scores:
+        return sum(scores) / len(scores)
+
+# endregion
+
+
+def apply_metadata(song, metadata, prefetched, deferred=None):
+    metadata.apply(song)
+    if deferred is None:
+        fill_cover(song, prefetched, metadata.cover_url)
+    else:
+        # Text is available now, the cover follows when its download completes
+        deferred.append(deferred_executor.submit(deadline.wrap(fill_cover), song, prefetched, metadata.cover_url))
+
+
+def fill_cover(song, prefetched, url):
+    cover = await_cover(prefetched)
+    if not cover and url:
+        try:
+            cover = download_cover(url)
+        except deadline.DeadlineExceeded:
+            # The text is already applied, go without a cover
+            cover = None
+    if cover:
+        song.cover = cover
+    return cover
+
+
+def prefetch_cover(wikipage):
+    # The lead image is known from resolution, download it while the infobox is fetched and parsed
+    url = lead_image(wikipage)
+    if url:
+        return cover_executor.submit(deadline.wrap(download_cover), url)
+
+
+def await_cover(future):
+    if future:
+        try:
+            return future.result()
+        except requests.RequestException as e:
+            print(e)
+
+
+def lead_image(page):
+    return getattr(page, 'image', None)
+
+
+def collect_metadata(wikipage):
+    found, metadata = cached_metadata(wikipage)
+    if found:
+        return metadata
+    try:
+        # Songs resolving to the same page share one download and one parse
+        return flight.do('metadata:{}'.format(metadata_key(wikipage)), fetch_and_store_metadata, wikipage)
+    except mediawiki.MediaWikiError as e:
+        print(e)
+
+
+def fetch_and_store_metadata(wikipage):
+    metadata = fetch_metadata(wikipage)
+    store_metadata(wikipage, metadata)
+    return metadata
+
+
+def cached_metadata(wikipage):
+    data = metadata_cache.get(metadata_key(wikipage)) if wikipage.revid else None
+    if data is None:
+        return False, None
+    return True, model.Metadata.unpack(data) if data else None
+
+
+def store_metadata(wikipage, metadata):
+    if wikipage.revid:
+        metadata_cache.set(metadata_key(wikipage), metadata.pack() if metadata else '')
+
+
+def fetch_metadata(wikipage):
+    if LEAD_SECTION:
+        # The infobox lives in the lead section, only fall back to the full article when it is missing
+        metadata = parse_metadata(page_html(wikipage, 0))
+        if metadata:
+            return metadata
+    return parse_metadata(page_html(wikipage))
+
+
+def parse_metadata(html):
     soup = BeautifulSoup(html, 'html.parser')
 
     table = soup.find('table', 'infobox vevent')
     if not table:
-        # Wrong page
-        return False
+        return
+
+    metadata = model.Metadata()
+    summary = table.find(class_='summary') or table.find('th')
+    if summary:
+        metadata.title = summary.text.strip().strip('"')
+    for header in table.findAll('th', limit=4):
+        by = BY.search(header.text.strip())
+        if by:
+            metadata.artist = by.group(1).strip()
+            break
 
     found = 0
     rows = table.findAll('tr')
@@ -71,46 +538,77 @@ def scrape_metadata(song, wikipage):
                 if i:
                     a = i.find('a')
                     if a:
-                        song.album = a.text
+                        metadata.album = a.text
                     elif i.text:
-                        song.album = i.text
+                        metadata.album = i.text
             elif header.text == 'Released':
                 found += 1
                 data = row.find('td')
                 if data:
-                    song.release = util.extract_year(data.text)
+                    metadata.release = util.extract_year(data.text)
             elif header.text == 'Genre':
                 found += 1
                 data = row.find('td')
                 if data:
-                    song.genres = util.clean_genres([a.text for a in data.findAll('a')])
+                    metadata.genres = util.clean_genres([a.text for a in data.findAll('a')])
 
     img = table.find('img')
     if img:
-        song.cover = download_cover('https:{}'.format(img.get('src')))
+        metadata.cover_url = 'https:{}'.format(img.get('src'))
 
-    return True
+    return metadata
 
 
 def download_cover(url):
-    response = http_request(url)
-    if response:
-        mime = response.info().get('Content-Type')
-        if 'image' in mime:
-            return model.Cover(response.read(), mime)
+    thumbnail = util.thumbnail_url(url, COVER_WIDTH)
+    cover = covers.store.get(thumbnail)
+    if cover:
+        return cover
+    return flight.do('cover:{}'.format(thumbnail), fetch_cover, thumbnail, url)
+
+
+def fetch_cover(thumbnail, url):
+    # The original is only requested when no thumbnail can be rendered (e.g. it is smaller than COVER_WIDTH)
+    for candidate in dict.fromkeys([thumbnail, url]):
+        image = hedge.call('cover', read_image, candidate)
+        if image:
+            return covers.store.put(thumbnail, *image)
+
+
+def read_image(url):
+    response = http_request(url, stream=True)
+    if not response:
+        return
+    with response:
+        mime = response.headers.get('Content-Type', '')
+        length = int(response.headers.get('Content-Length') or 0)
+        if not mime.startswith('image/') or length > MAX_COVER_BYTES:
+            debug.log('[COVER] Skipped {} ({}, {} bytes)'.format(url, mime, length))
+            return
+        data = bytearray()
+        try:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                data += chunk
+                if len(data) > MAX_COVER_BYTES:
+                    debug.log('[COVER] Aborted {} after {} bytes'.format(url, len(data)))
+                    return
+        except requests.RequestException as e:
+            print(e)
+            return
+        return bytes(data), mime
 
 
 # region Helper
-def http_request(request):
+def http_request(url, **kwargs):
+    response = None
     try:
-        return urllib.request.urlopen(request)
-    except ValueError:
-        pass
-    except urllib.error.URLError as e:
+        response = pool.get(url, **kwargs)
+        response.raise_for_status()
+        return response
+    except requests.RequestException as e:
         print(e)
-
-
-def build_request(url, headers=None):
-    return urllib.request.Request(url=url, headers=headers)
+        if response is not None:
+            # A streamed body is never read on errors, hand its connection back to the pool
+            response.close()
 
 # endregion
@@ -0,0 +1,270 @@
+import threading
+import collections
+from wikimusic import network, mediawiki, collector, deadline, planner
+
+# region Constants
+QUEUE_SIZE = 50
+WORKERS = collections.OrderedDict([
+    ('resolve', 4),
+    ('fetch', 8),
+    ('parse', 2),
+    ('cover', 8),
+    ('apply', 1),
+])
+# endregion
+
+
+class Stage(object):
+    def __init__(self, name, handler, workers, size=QUEUE_SIZE):
+        self.name = name
+        self.size = size
+        self.workers = workers
+        self.processed = 0
+        self.__handler = handler
+        self.__queue = collections.deque()
+        self.__retries = collections.deque()
+        self.__condition = threading.Condition()
+
+    # region Methods
+    def start(self):
+        for _ in range(self.workers):
+            threading.Thread(target=self.__run, daemon=True).start()
+
+    def put(self, job):
+        # Forward edges block while the stage is full
+        with self.__condition:
+            while len(self.__queue) >= self.size:
+                self.__condition.wait()
+            self.__queue.append(job)
+            self.__condition.notify_all()
+
+    def retry(self, job):
+        # Back edges never block, otherwise two full stages could wait on each other
+        with self.__condition:
+            self.__retries.append(job)
+            self.__condition.notify_all()
+
+    # endregion
+
+    # region Properties
+    @property
+    def depth(self):
+        return len(self.__queue) + len(self.__retries)
+
+    # endregion
+
+    # region Helpers
+    def __run(self):
+        while True:
+            with self.__condition:
+                while not self.__queue and not self.__retries:
+                    self.__condition.wait()
+                job = self.__retries.popleft() if self.__retries else self.__queue.popleft()
+                self.__condition.notify_all()
+            self.__handler(job)
+            self.processed += 1
+
+    # endregion
+    pass
+
+
+class Job(object):
+    def __init__(self, item):
+        self.item = item
+        self.song = item.model
+        self.queries = planner.plan(self.song)
+        self.attempt = 0
+        self.candidates = None
+        self.page = None
+        self.section = None
+        self.html = None
+        self.metadata = None
+        self.cover = None
+        self.prefetched = None
+        self.tentative = None
+        self.progress = 0
+        self.deadline = None
+        self.expired = False
+        self.announced = False
+
+    @property
+    def query(self):
+        if self.attempt < len(self.queries):
+            return self.queries[self.attempt]
+
+
+class Pipeline(object):
+    def __init__(self, send, progress, collected, covered, workers=None, size=QUEUE_SIZE):
+        self.__send = send
+        self.__progress = progress
+        self.__collected = collected
+        self.__covered = covered
+        workers = dict(WORKERS, **(workers or {}))
+        self.resolve = Stage('resolve', self.__budgeted(self.__resolve), workers['resolve'], size)
+        self.fetch = Stage('fetch', self.__budgeted(self.__fetch), workers['fetch'], size)
+        self.parse = Stage('parse', self.__budgeted(self.__parse), workers['parse'], size)
+        self.cover = Stage('cover', self.__budgeted(self.__cover), workers['cover'], size)
+        self.apply = Stage('apply', self.__apply, workers['apply'], size)
+        self.stages = [self.resolve, self.fetch, self.parse, self.cover, self.apply]
+        for stage in self.stages:
+            stage.start()
+
+    # region Methods
+    def put(self, item):
+        self.resolve.put(Job(item))
+
+    def depths(self):
+        return collections.OrderedDict((stage.name, stage.depth) for stage in self.stages)
+
+    # endregion
+
+    # region Stages
+    def __resolve(self, job):
+        if job.candidates is None:
+            if job.query is None:
+                return self.__fail(job)
+            self.send(job, 'Page Request')
+            title = job.query.title
+            if network.known_miss(title):
+                self.send(job, 'Known miss')
+                return self.__fail(job)
+            pages = network.request_wiki_page(title)
+            self.advance(job)
+            if not pages:
+                return self.__fail(job)
+            if len(pages) == 1:
+                job.candidates = iter([lambda: pages[0]])
+            elif network.PARALLEL_FILTERS:
+                job.candidates = iter([lambda: network.top_k_filter(pages, job.query.artist)])
+            else:
+                job.candidates = iter([
+                    lambda: network.similarity_threshold_filter(pages, job.query.artist),
+                    lambda: network.perfect_match_filter(pages, '(song)'),
+                ])
+
+        for candidate in job.candidates:
+            page = candidate()
+            self.advance(job)
+            if page:
+                job.page = page
+                job.prefetched = network.prefetch_cover(page)
+                job.section = 0 if network.LEAD_SECTION else None
+                self.send(job, 'Scraping')
+                return self.fetch.put(job)
+        self.__fail(job)
+
+    def __fetch(self, job):
+        found, metadata = network.cached_metadata(job.page)
+        if found:
+            return self.__parsed(job, metadata)
+        try:
+            job.html = network.page_html(job.page, job.section)
+        except mediawiki.MediaWikiError as e:
+            print(e)
+            return self.resolve.retry(job)
+        self.parse.put(job)
+
+    def __parse(self, job):
+        metadata = network.parse_metadata(job.html)
+        job.html = None
+        if not metadata and job.section is not None:
+            # No infobox in the lead section, try the full article
+            job.section = None
+            return self.fetch.retry(job)
+        network.store_metadata(job.page, metadata)
+        self.__parsed(job, metadata)
+
+    def __cover(self, job):
+        job.cover = network.await_cover(job.prefetched)
+        if not job.cover and job.metadata.cover_url:
+            job.cover = network.download_cover(job.metadata.cover_url)
+        self.apply.put(job)
+
+    def __apply(self, job):
+        if not job.announced:
+            # Out of time, a doubtful page found so far still beats nothing
+            if not (job.expired and self.__settle(job)):
+                self.__announce(job)
+            elif job.prefetched:
+                # Its cover was prefetched under the same budget, no time is left to download the infobox image
+                job.cover = network.await_cover(job.prefetched)
+        if job.cover:
+            job.song.cover = job.cover
+        self.__covered(job.item)
+
+    # endregion
+
+    # region Helpers
+    def __announce(self, job):
+        # Text goes out as soon as it is parsed, the cover follows from the apply stage
+        complete = bool(job.metadata)
+        job.announced = True
+        if complete:
+            job.metadata.apply(job.song)
+        self.advance(job, collector.MAX - job.progress)
+        if job.expired:
+            self.send(job, collector.TIMEOUT)
+        self.send(job, collector.SUCCESS if complete else collector.FAILURE)
+        self.__collected(job.item, complete)
+
+    def __budgeted(self, handler):
+        def run(job):
+            if job.deadline is None:
+                job.deadline = deadline.for_item()
+            with deadline.scope(job.deadline):
+                try:
+                    deadline.check()
+                    handler(job)
+                except deadline.DeadlineExceeded:
+                    # Out of time, hand over whatever was found so far
+                    job.expired = True
+                    self.apply.retry(job)
+        return run
+
+    def __parsed(self, job, metadata):
+        self.advance(job)
+        if metadata:
+            accepted, score, job.tentative = network.weigh(metadata, job.query, job.prefetched, job.tentative)
+            if accepted:
+                return self.__accept(job, metadata)
+            # Not convincingly this song, escalate to the rest of the cascade
+            self.send(job, 'Confidence {:.2f}'.format(score))
+        # Wrong page, continue with the next candidate
+        self.resolve.retry(job)
+
+    def __accept(self, job, metadata):
+        job.metadata = metadata
+        planner.record(job.queries, job.query, True)
+        self.__announce(job)
+        self.cover.put(job)
+
+    def __fail(self, job):
+        job.attempt += 1
+        if job.query:
+            # Next planned query
+            job.candidates = None
+            return self.resolve.retry(job)
+        if self.__settle(job):
+            return self.cover.put(job)
+        self.apply.put(job)
+
+    def __settle(self, job):
+        tentative = network.settle(job.tentative)
+        if tentative:
+            job.metadata = tentative.metadata
+            job.prefetched = tentative.prefetched
+            planner.record(job.queries, tentative.query, True)
+            self.__announce(job)
+        return tentative
+
+    def advance(self, job, value=1):
+        value = min(value, collector.MAX - job.progress)
+        job.progress += value
+        if value:
+            self.__progress(value)
+
+    def send(self, job, status):
+        self.__send(job.item, status)
+
+    # endregion
+    pass
@@ -0,0 +1,122 @@
+import re
+import threading
+import collections
+from wikimusic import util
+
+# region Constants
+TRACK_NUMBER = re.compile(r'^\s*(?:\d{1,3}\s*[-._)]\s*|0\d\s+)(?=\S)')
+SEPARATOR = re.compile(r'\s+[-–—]\s+|_-_')
+PATTERNS = collections.OrderedDict([
+    ('video', re.compile(r'\s*[(\[][^)\]]*\b(?:official|video|audio|lyrics?|visuali[sz]er|hd|hq)\b[^)\]]*[)\]]',
+                         re.IGNORECASE)),
+    ('edit', re.compile(r'\s*[(\[][^)\]]*\b(?:radio|single|album|extended|clean|explicit)\s+(?:edit|version|mix)\b'
+                        r'[^)\]]*[)\]]', re.IGNORECASE)),
+    ('remaster', re.compile(r'\s*[(\[][^)\]]*\bremaster(?:ed)?\b[^)\]]*[)\]]|\s+-\s+(?:\d{4}\s+)?remaster(?:ed)?.*$',
+                            re.IGNORECASE)),
+    ('featuring', re.compile(r'\s*[(\[]\s*(?:feat\.?|ft\.?|featuring)\s[^)\]]*[)\]]|\s+(?:feat\.?|ft\.?|featuring)\s.*$',
+                             re.IGNORECASE)),
+])
+# endregion
+
+
+class Query(object):
+    def __init__(self, title, artist, patterns, fallback=False, raw=None, name=None):
+        self.title = title
+        self.name = name or title
+        self.artist = artist
+        self.patterns = patterns
+        self.fallback = fallback
+        self.raw = raw
+
+    @property
+    def cleaned(self):
+        return bool(self.patterns)
+
+    def __repr__(self):
+        return 'Query({!r})'.format(self.title)
+
+
+class QueryPlanner(object):
+    def __init__(self):
+        self.saved = 0
+        self.matched = collections.Counter()
+        self.hits = collections.Counter()
+        self.ranks = collections.Counter()
+        self.__lock = threading.Lock()
+
+    # region Methods
+    def plan(self, song, count=True):
+        # Ranked queries: the cleaned title, then the title disambiguated by artist
+        if not song.title:
+            return []
+        title, patterns = clean(song.title)
+        artist, artist_patterns = clean(song.artist) if song.artist else (None, [])
+        queries = [Query(title, artist or '', patterns, raw=song.title)]
+        if artist:
+            queries.append(Query('{} ({})'.format(title, artist), artist, patterns + artist_patterns, True,
+                                 '{} ({})'.format(song.title, song.main_artist), title))
+        if count:
+            with self.__lock:
+                for name in set(patterns + artist_patterns):
+                    self.matched[name] += 1
+        return queries
+
+    def record(self, queries, query, hit):
+        if not hit:
+            return
+        with self.__lock:
+            self.ranks[queries.index(query)] += 1
+            for name in set(query.patterns):
+                self.hits[name] += 1
+            if query.cleaned and util.normalize_title(query.title) != util.normalize_title(query.raw):
+                # The uncleaned query would have gone out first and most likely missed
+                self.saved += 1
+
+    # endregion
+
+    # region Properties
+    @property
+    def stats(self):
+        with self.__lock:
+            rates = {name: {'matched': self.matched[name], 'hits': self.hits[name],
+                            'rate': self.hits[name] / self.matched[name] if self.matched[name] else None}
+                     for name in PATTERNS}
+            return {'patterns': rates, 'ranks': dict(self.ranks), 'saved': self.saved}
+
+    # endregion
+    pass
+
+
+def clean(value, patterns=PATTERNS):
+    matched = []
+    for name, pattern in patterns.items():
+        cleaned, n = pattern.subn('', value)
+        if n and cleaned.strip():
+            value = cleaned
+            matched.append(name)
+    return ' '.join(value.split()), matched
+
+
+def extract_artist_title(file):
+    name = util.file_name(file)
+    stripped = TRACK_NUMBER.sub('', name)
+    if SEPARATOR.search(stripped):
+        # Only a leading number followed by 'artist - title' is a track number, not a band called 311
+        name = stripped
+    # Tags keep featured artists and edits, plan() cleans them for the queries only
+    return [part.strip() for part in SEPARATOR.split(name, maxsplit=1)]
+
+
+planner = QueryPlanner()
+
+
+def plan(song, count=True):
+    return planner.plan(song, count)
+
+
+def record(queries, query, hit):
+    planner.record(queries, query, hit)
+
+
+def stats():
+    return planner.stats
@@ -0,0 +1,97 @@
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from wikimusic import limiter, retry, deadline
+
+# region Constants
+USER_AGENT = 'WikiMusic/1.0 (https://github.com/Python3Development/WikiMusic)'
+HOSTS = 10
+CONNECTIONS_PER_HOST = 10
+TIMEOUT = 10
+THROTTLE_RETRIES = 5
+# endregion
+
+# One keep-alive pool per host, shared by all collectors (wikipedia.org and upload.wikimedia.org).
+# The limiter bounds concurrency, a non-blocking pool never waits for a connection outside the item's budget
+adapter = HTTPAdapter(pool_connections=HOSTS, pool_maxsize=CONNECTIONS_PER_HOST, pool_block=False)
+session = requests.Session()
+session.headers.update({'User-Agent': USER_AGENT, 'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+session.mount('https://', adapter)
+session.mount('http://', adapter)
+
+
+def get(url, **kwargs):
+    host = urlsplit(url).netloc
+    breaker = retry.breaker(host)
+    for attempt in range(retry.policy.attempts):
+        deadline.check()
+        if not breaker.allow():
+            raise retry.CircuitOpenError('Circuit open for {}'.format(host))
+        try:
+            response = throttled_get(url, **kwargs)
+        except deadline.DeadlineExceeded:
+            # Out of budget says nothing about the host, keep it out of the breaker and the retries
+            raise
+        except retry.TRANSIENT_ERRORS:
+            breaker.failure()
+            if attempt + 1 == retry.policy.attempts:
+                raise
+        else:
+            if not retry.transient(response):
+                breaker.success()
+                return response
+            breaker.failure()
+            if attempt + 1 == retry.policy.attempts:
+                return response
+            response.close()
+        retry.policy.backoff(attempt)
+
+
+def throttled_get(url, **kwargs):
+    limit = limiter.get(urlsplit(url).netloc)
+    for attempt in range(THROTTLE_RETRIES + 1):
+        # Raises DeadlineExceeded without holding a slot when the budget runs out while queued
+        limit.acquire()
+        budgeted = False
+        try:
+            deadline.check()
+            remaining = deadline.remaining()
+            budgeted = remaining is not None and remaining < TIMEOUT
+            kwargs['timeout'] = remaining if budgeted else TIMEOUT
+            response = session.get(url, **kwargs)
+        except requests.Timeout as e:
+            if isinstance(e, deadline.DeadlineExceeded):
+                limit.cancel()
+                raise
+            if budgeted:
+                # Timed out on the cut-down timeout, the budget ran out rather than the host
+                limit.cancel()
+                raise deadline.DeadlineExceeded('Deadline exceeded waiting for {}'.format(url)) from e
+            limit.release(failed=True)
+            raise
+        except requests.RequestException:
+            limit.release(failed=True)
+            raise
+        delay = limiter.retry_after(response)
+        limit.release(delay)
+        # Throttling is retried here, server errors (503 included) only by get's retry policy
+        if delay is None or retry.transient(response) or attempt == THROTTLE_RETRIES:
+            return response
+        response.close()
+
+
+def stats():
+    hosts = {}
+    pools = adapter.poolmanager.pools
+    for key in pools.keys():
+        pool = pools.get(key)
+        if pool:
+            hosts[pool.host] = {'requests': pool.num_requests, 'connections': pool.num_connections}
+    sent = sum(h['requests'] for h in hosts.values())
+    opened = sum(h['connections'] for h in hosts.values())
+    return {
+        'hosts': hosts,
+        'requests': sent,
+        'connections': opened,
+        'reuse_rate': 1 - opened / sent if sent else 0.0,
+    }
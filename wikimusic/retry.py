@@ -0,0 +1,113 @@
+import random
+import threading
+from time import time, sleep
+import requests
+from wikimusic import deadline
+
+# region Constants
+ATTEMPTS = 3
+BASE_DELAY = 0.5
+MAX_DELAY = 8.0
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30.0
+# endregion
+
+TRANSIENT_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+
+class CircuitOpenError(requests.ConnectionError):
+    pass
+
+
+class RetryPolicy(object):
+    def __init__(self, attempts=ATTEMPTS, base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self.delay = 0.0
+        self.__lock = threading.Lock()
+
+    def backoff(self, attempt):
+        # Full jitter keeps retrying collectors from hitting the host in lockstep
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        remaining = deadline.remaining()
+        if remaining is not None:
+            delay = min(delay, remaining)
+        with self.__lock:
+            self.retries += 1
+            self.delay += delay
+        sleep(delay)
+
+
+class CircuitBreaker(object):
+    def __init__(self, threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.trips = 0
+        self.__opened = None
+        self.__trial = False
+        self.__lock = threading.Lock()
+
+    # region Methods
+    def allow(self):
+        with self.__lock:
+            if self.__opened is None:
+                return True
+            if not self.__trial and time() - self.__opened >= self.reset_timeout:
+                # Half open, let a single request probe the host
+                self.__trial = True
+                return True
+            return False
+
+    def success(self):
+        with self.__lock:
+            self.failures = 0
+            self.__opened = None
+            self.__trial = False
+
+    def failure(self):
+        with self.__lock:
+            self.failures += 1
+            if self.__trial or (self.__opened is None and self.failures >= self.threshold):
+                self.trips += 1
+                self.__opened = time()
+                self.__trial = False
+
+    # endregion
+
+    # region Properties
+    @property
+    def state(self):
+        if self.__opened is None:
+            return 'closed'
+        return 'half-open' if self.__trial else 'open'
+
+    # endregion
+    pass
+
+
+policy = RetryPolicy()
+breakers = {}
+lock = threading.Lock()
+
+
+def breaker(host):
+    with lock:
+        if host not in breakers:
+            breakers[host] = CircuitBreaker()
+        return breakers[host]
+
+
+def transient(response):
+    return response.status_code >= 500
+
+
+def stats():
+    return {
+        'retries': policy.retries,
+        'retry_delay': round(policy.delay, 2),
+        'trips': sum(b.trips for b in breakers.values()),
+        'breakers': {host: b.state for host, b in breakers.items()},
+    }
@@ -1,14 +1,15 @@
 from PyQt5 import QtCore
-from wikimusic import network, view
+from wikimusic import network, view, collector, pipeline
 
 
 class CollectorThread(QtCore.QThread):
     # region Constants
-    MAX = 10
+    MAX = collector.MAX
     # endregion
 
     # region Signals
     collected = QtCore.pyqtSignal(view.MetaMusicListItem, bool)
+    cover_collected = QtCore.pyqtSignal(view.MetaMusicListItem)
     status_update = QtCore.pyqtSignal(view.MetaMusicListItem, str)
     global_progress_update = QtCore.pyqtSignal(int)
     # endregion
@@ -16,7 +17,6 @@ class CollectorThread(QtCore.QThread):
     def __init__(self):
         super().__init__()
         self.q = None
-        self.__i = 0
 
     def run(self):
         if self.q:
@@ -27,76 +27,60 @@ class CollectorThread(QtCore.QThread):
 
     # region Main Execution
     def process(self, item):
-        self.send(item, 'Page Request')
-        complete = self.process_request(item)
-        self.i = self.MAX/2
-        if complete:
-            self.i = self.MAX
-            self.send(item, "<font color='green'>Success</font>")
-            self.collected.emit(item, True)
-            return
-
-        self.send(item, 'Page Request')
-        complete = self.process_request(item, True)
-        self.i = self.MAX
-        self.send(item, "<font color='green'>Success</font>" if complete else "<font color='red'>Failure</font>")
+        lookup = collector.Collector(item, self.send, self.global_progress_update.emit)
+        complete = lookup.run()
         self.collected.emit(item, complete)
+        lookup.when_covered(lambda: self.cover_collected.emit(item))
+    # endregion
 
-    def process_request(self, item, fallback=False):
-        song = item.model
-        title = '{} ({})'.format(song.title, song.main_artist) if fallback else song.title
-        pages = network.request_wiki_page(title)
-        self.i += 1
-        if pages:
-            if len(pages) == 1:
-                self.send(item, 'Scraping')
-                scrape = network.scrape_metadata(song, pages[0])
-                self.i += 1
-                return scrape
-            else:
-                self.send(item, 'Filter (artist)')
-                page = network.similarity_threshold_filter(pages, song.main_artist)
-                self.i += 1
-                if page:
-                    self.send(item, 'Scraping')
-                    scrape = network.scrape_metadata(song, page)
-                    self.i += 1
-                    if not scrape:
-                        self.send(item, 'Filter (song)')
-                        page = network.perfect_match_filter(pages, '(song)')
-                        self.i += 1
-                        if page:
-                            self.send(item, 'Scraping')
-                            scrape = network.scrape_metadata(song, page)
-                            self.i += 1
-                            return scrape
-                    return scrape
-                else:
-                    self.send(item, 'Filter (song)')
-                    page = network.perfect_match_filter(pages, '(song)')
-                    self.i += 1
-                    if page:
-                        self.send(item, 'Scraping')
-                        scrape = network.scrape_metadata(song, page)
-                        self.i += 1
-                        return scrape
-        return False
+    # region Helpers
+    def send(self, item, status):
+        self.status_update.emit(item, status)
     # endregion
 
-    # region Properties
-    @property
-    def i(self):
-        return self.__i
+    pass
+
 
-    @i.setter
-    def i(self, value):
-        self.global_progress_update.emit(value - self.__i)
-        self.__i = value % self.MAX
+class PipelineThread(QtCore.QThread):
+    # region Constants
+    MAX = collector.MAX
     # endregion
 
+    # region Signals
+    collected = QtCore.pyqtSignal(view.MetaMusicListItem, bool)
+    cover_collected = QtCore.pyqtSignal(view.MetaMusicListItem)
+    status_update = QtCore.pyqtSignal(view.MetaMusicListItem, str)
+    global_progress_update = QtCore.pyqtSignal(int)
+    # endregion
+
+    def __init__(self, workers=None):
+        super().__init__()
+        self.q = None
+        self.pipeline = pipeline.Pipeline(self.send, self.global_progress_update.emit, self.collected.emit,
+                                          self.cover_collected.emit, workers)
+
+    def run(self):
+        # Feed the first stage, blocking while its queue is full
+        if self.q:
+            while True:
+                item = self.q.get()
+                self.pipeline.put(item)
+                self.q.task_done()
+
     # region Helpers
     def send(self, item, status):
         self.status_update.emit(item, status)
     # endregion
 
     pass
+
+
+class RevalidateThread(QtCore.QThread):
+    # region Signals
+    revalidated = QtCore.pyqtSignal(int)
+    # endregion
+
+    def run(self):
+        self.revalidated.emit(network.revalidate_cache())
+
+    pass
@@ -2,7 +2,6 @@ import os
 import glob
 import base64
 import re
-import difflib
 from PyQt5 import QtCore
 
 from PyQt5 import QtWidgets, QtGui
@@ -51,8 +50,8 @@ def extract_mp3(path):
 
 
 # String
-def extract_artist_title(file):
-    return [s.strip() for s in file_name(file).split(' - ')]
+def normalize_title(title):
+    return ' '.join(title.split()).casefold()
 
 
 def clean_genres(genres):
@@ -73,8 +72,15 @@ def is_int(value):
         return False
 
 
-def similarity(value, value2):
-    return difflib.SequenceMatcher(lambda x: x == ' ', value, value2).ratio()
+def thumbnail_url(url, width):
+    # Wikimedia serves any width of an image under /thumb/<hash path>/<width>px-<name>
+    match = re.match(r'(https?://upload\.wikimedia\.org/.+?/)thumb/(.+)/\d+px-([^/]+)$', url)
+    if match:
+        return '{}thumb/{}/{}px-{}'.format(match.group(1), match.group(2), width, match.group(3))
+    match = re.match(r'(https?://upload\.wikimedia\.org/[^/]+/[^/]+/)([0-9a-f]/[0-9a-f]{2}/([^/]+))$', url)
+    if match and not url.lower().endswith('.svg'):
+        return '{}thumb/{}/{}px-{}'.format(match.group(1), match.group(2), width, match.group(3))
+    return url
 
 
 def parenthesis_content(s):
@@ -2,7 +2,7 @@ import os
 from PyQt5 import QtGui
 
 from PyQt5 import QtWidgets, QtCore
-from wikimusic import model, util
+from wikimusic import model, util, planner
 
 
 '''
@@ -265,7 +265,7 @@ class MetaMusicListItem(QtWidgets.QWidget):
             self.__default_line_edit(self.year_input, self.__model.release or 'Year')
 
             if not self.__model.artist or not self.__model.title:
-                artist_title = util.extract_artist_title(self.__model.file)
+                artist_title = planner.extract_artist_title(self.__model.file)
                 self.__model.artist = artist_title[0]
                 self.artist_input.setText(self.__model.artist)
                 if len(artist_title) > 1:
@@ -294,6 +294,10 @@ class MetaMusicListItem(QtWidgets.QWidget):
     def update(self):
         self.__populate()
 
+    def update_cover(self):
+        if self.__model:
+            self.cover_label.setCover(self.__model.cover)
+
     def update_status(self, status):
         self.status_label.lines += status
 